@@ -4,10 +4,14 @@ from discord import ui
 import os
 import google.generativeai as genai
 import asyncio
-import json
+import re
+import time
+import orjson
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError, ServerSelectionTimeoutError
 from keep_alive import keep_alive
 
 # --- Setup ---
@@ -17,20 +21,80 @@ MONGO_URL = os.getenv("MONGO_URL")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") 
 
 # --- Database ---
-cluster = MongoClient(MONGO_URL)
+cluster = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=50,       # Enough sockets for a burst of concurrent submissions
+    minPoolSize=5,        # Keep a few warm so the first requests skip the handshake
+    maxIdleTimeMS=60000,
+    retryWrites=True,
+    w=1
+)
 db = cluster["CollegeBot"]
 questions_col = db["questions"]
 submissions_col = db["submissions"]
 users_col = db["users"]
 
-# --- Global Cache for Timers ---
+async def ensure_indexes():
+    # One submission per student per question, enforced by the DB
+    try:
+        await submissions_col.create_index([("user_id", 1), ("question_id", 1)], unique=True)
+    except OperationFailure as e:
+        # Older check-then-insert code may have stored duplicates; don't block startup on it
+        print(f"⚠️ Unique (user_id, question_id) index NOT created - remove duplicate submissions and restart: {e}")
+    await users_col.create_index([("score", -1)])
+    # Persistent question view resolves its question by the posted message id
+    await questions_col.create_index("question_msg_id")
+
+# --- Global Cache for Timers (time.monotonic() start values) ---
 attempt_timers = {}
 
+# --- Pending Leaderboard Refreshes (question_id -> asyncio.Task) ---
+pending_refresh = {}
+LEADERBOARD_DEBOUNCE_SECONDS = 2
+
+# --- Queued User Score Updates (flushed in bulk; entries are (UpdateOne, attempts)) ---
+pending_score_ops = []
+SCORE_FLUSH_MAX_ATTEMPTS = 5
+# Transient write errors: upsert race on a new user, write conflict, primary stepdown/failover
+RETRYABLE_WRITE_CODES = {11000, 112, 91, 189, 10107, 11600, 11602, 13435}
+
 # --- AI Setup (FIXED: Switched to Stable Model) ---
 genai.configure(api_key=GEMINI_API_KEY)
 # We use 'gemini-pro' which is universally available on the free tier
 model = genai.GenerativeModel('gemini-pro')
 
+# Built once; filled per submission with format_map
+PROMPT_TEMPLATE = """
+    Role: Senior Computer Science Professor.
+    Task 1: Grade the code strictly based on correctness and efficiency.
+    Task 2: Detect AI generation (ChatGPT style).
+
+    Question: {title}
+    Description: {desc}
+    Language: {lang}
+    Code:
+    {code}
+
+    OUTPUT JSON ONLY (keep this key order):
+    {{
+        "is_ai_suspected": (true/false),
+        "score": (0-100),
+        "feedback": "(Professional, constructive feedback. Max 2 sentences.)",
+        "status": "Pass" or "Fail"
+    }}
+    """
+
+# Seen mid-stream -> stop generating, the submission is rejected anyway
+AI_FLAG_RE = re.compile(r'"is_ai_suspected"\s*:\s*true', re.IGNORECASE)
+AI_TIMEOUT_SECONDS = 10
+
+# Cap concurrent Gemini calls; extra submissions queue here instead of hitting quota
+AI_MAX_CONCURRENCY = 8
+AI_SEM = None  # Created in setup_hook (on Python 3.9 a Semaphore binds to the loop it's built on)
+
+# Resolved once in on_ready; embeds reuse the plain string
+BOT_AVATAR_URL = None
+
 intents = discord.Intents.all()
 bot = commands.Bot(command_prefix="!", intents=intents)
 
@@ -47,67 +111,170 @@ COLOR_WARNING = 0xFEE75C
 COLOR_DANGER = 0xED4245
 COLOR_GOLD = 0xFFD700
 
-# --- Helper: Grade with AI (Stable) ---
-async def grade_submission(title, desc, code, lang):
-    prompt = f"""
-    Role: Senior Computer Science Professor.
-    Task 1: Grade the code strictly based on correctness and efficiency.
-    Task 2: Detect AI generation (ChatGPT style).
+# --- Rank Icons (index = rank; ranks past the table show as "**N.**") ---
+LIVE_ICONS = ("", "🥇", "🥈", "🥉", "🏅", "🏅", "🏅", "🏅", "🏅", "🏅", "🏅")
+GLOBAL_ICONS = ("", "🏆", "🥈", "🥉")
 
-    Question: {title}
-    Description: {desc}
-    Language: {lang}
-    Code:
-    {code}
+# --- Sloppy Paste Filter (single case-insensitive scan) ---
+BANNED_RE = re.compile(r"here is the code|as an ai|hope this helps", re.IGNORECASE)
 
-    OUTPUT JSON ONLY:
-    {{
-        "score": (0-100),
-        "feedback": "(Professional, constructive feedback. Max 2 sentences.)",
-        "status": "Pass" or "Fail",
-        "is_ai_suspected": (true/false)
-    }}
-    """
+# --- Helper: Grade with AI (Stable) ---
+async def _stream_grade(prompt):
+    # Returns the raw model text, or a ready-made result when short-circuited
+    raw_text = ""
+    async for chunk in await model.generate_content_async(prompt, stream=True):
+        if not chunk.parts:
+            continue
+        raw_text += chunk.text
+        if AI_FLAG_RE.search(raw_text):
+            return {"score": 0, "feedback": "", "status": "Fail", "is_ai_suspected": True}
+    return raw_text
+
+async def grade_submission(title, desc, code, lang):
+    prompt = PROMPT_TEMPLATE.format_map({"title": title, "desc": desc, "lang": lang, "code": code})
     try:
-        # Run in separate thread to prevent blocking
-        response = await asyncio.to_thread(model.generate_content, prompt)
-        
+        # Stream the answer so AI-flagged code is rejected before generation finishes
+        # Timeout covers generation only, not time spent queued for a slot
+        async with AI_SEM:
+            raw_text = await asyncio.wait_for(_stream_grade(prompt), timeout=AI_TIMEOUT_SECONDS)
+        if isinstance(raw_text, dict):
+            return raw_text
+
         # Safety Check
-        if not response.parts:
+        if not raw_text:
             return {"score": 0, "feedback": "Code blocked by Safety Filters.", "status": "Fail", "is_ai_suspected": False}
-        
+
+        try:
+            # Fast path: model returned bare JSON
+            return orjson.loads(raw_text)
+        except orjson.JSONDecodeError:
+            pass
+
         # Manual JSON Cleaning (Crucial for gemini-pro)
-        raw_text = response.text
         if "```json" in raw_text:
             raw_text = raw_text.split("```json")[1].split("```")[0].strip()
         elif "```" in raw_text:
             raw_text = raw_text.split("```")[1].split("```")[0].strip()
             
-        return json.loads(raw_text)
+        return orjson.loads(raw_text)
 
+    # None = no grade (timeout / system error): the caller must not record anything
+    except asyncio.TimeoutError:
+        print("❌ AI ERROR: grading timed out")
+        return None
     except Exception as e:
         print(f"❌ AI ERROR: {e}")
-        return {"score": 0, "feedback": f"System Error: {str(e)[:50]}...", "status": "Fail", "is_ai_suspected": False}
+        return None
+
+# --- Helper: Record Submission on the Question's Leaderboard ---
+async def record_submission(question_id, user_id, score, duration):
+    # Atomic push into a sorted, capped Top 50 array + submission counter
+    await questions_col.update_one({"_id": question_id}, {
+        "$push": {"top": {
+            "$each": [{"user_id": user_id, "score": score, "duration_seconds": duration}],
+            "$sort": {"score": -1, "duration_seconds": 1},
+            "$slice": 50
+        }},
+        "$inc": {"sub_count": 1}
+    })
+
+async def backfill_leaderboards():
+    # Rebuild questions.top for live questions that are out of step with submissions:
+    # posted before top existed (no sub_count yet) or a record_submission write failed
+    async for q in questions_col.find({"active": True}, projection={"_id": 1, "sub_count": 1}):
+        sub_count = await submissions_col.count_documents({"question_id": q["_id"]})
+        if q.get("sub_count") == sub_count:
+            continue
+
+        top = await submissions_col.find(
+            {"question_id": q["_id"]},
+            projection={"_id": 0, "user_id": 1, "score": 1, "duration_seconds": 1}
+        ).sort([("score", -1), ("duration_seconds", 1)]).limit(50).to_list(50)
+        await questions_col.update_one(
+            {"_id": q["_id"], "sub_count": q.get("sub_count")},
+            {"$set": {"top": top, "sub_count": sub_count}}
+        )
+        print(f"🔧 Rebuilt leaderboard for {q['_id']} ({sub_count} submissions)")
+
+# --- Background: Flush Queued Score Updates ---
+@tasks.loop(milliseconds=250)
+async def flush_score_updates():
+    if not pending_score_ops:
+        return
+    # Not requeued if the loop is cancelled mid-write: motor finishes the bulk_write
+    # in its worker thread regardless, so these ops are applied, just not awaited
+    batch = pending_score_ops[:]
+    pending_score_ops.clear()
+    try:
+        await users_col.bulk_write([op for op, _ in batch], ordered=False)
+    except BulkWriteError as e:
+        # Unordered: every op not listed in writeErrors was applied
+        for err in e.details["writeErrors"]:
+            op, attempts = batch[err["index"]]
+            attempts += 1
+            if err["code"] in RETRYABLE_WRITE_CODES and attempts < SCORE_FLUSH_MAX_ATTEMPTS:
+                pending_score_ops.append((op, attempts))
+            else:
+                print(f"❌ Score update dropped after {attempts} attempt(s): {op} -> {err.get('errmsg')}")
+    except ServerSelectionTimeoutError as e:
+        # No server was reachable, so nothing was sent -> safe to retry the whole batch
+        pending_score_ops.extend(batch)
+        print(f"❌ Score flush failed ({len(batch)} ops), requeued: {e}")
+    except PyMongoError as e:
+        # Outcome unknown (e.g. connection dropped mid-write); a retry could count points twice
+        print(f"❌ Score flush outcome unknown, NOT retried - check these by hand: {[op for op, _ in batch]} ({e})")
+
+@flush_score_updates.after_loop
+async def drain_score_updates():
+    # The loop is cancelled on shutdown -> write whatever is still queued
+    await flush_score_updates()
+    if pending_score_ops:
+        print(f"❌ {len(pending_score_ops)} score updates could not be saved before shutdown")
+
+# --- Helper: Resolve Members in Bulk ---
+async def resolve_members(guild, user_ids):
+    # Cache hits are free; everything else is fetched in ONE gateway request
+    members = {}
+    missing = []
+    for uid in user_ids:
+        member = guild.get_member(uid)
+        if member:
+            members[uid] = member
+        else:
+            missing.append(uid)
+
+    if missing:
+        try:
+            for member in await guild.query_members(limit=100, user_ids=missing[:100], cache=True):
+                members[member.id] = member
+        except asyncio.TimeoutError:
+            pass
+    return members
 
 # --- Helper: Update Live Leaderboard ---
 async def update_live_leaderboard(question_id, guild):
-    question_data = questions_col.find_one({"_id": question_id})
+    # Top 50 + count are kept pre-sorted on the question doc (see record_submission)
+    question_data = await questions_col.find_one({"_id": question_id})
     if not question_data or "leaderboard_msg_id" not in question_data:
         return
 
-    # Get Top 50 Submissions
-    subs = list(submissions_col.find({"question_id": question_id}).sort([("score", -1), ("duration_seconds", 1)]))
+    subs = question_data.get("top", [])
+    total_subs = question_data.get("sub_count", 0)
 
-    # Build Description
-    desc = f"**Problem:** {question_data['title']}\n**Total Submissions:** {len(subs)}\n"
-    desc += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+    # Build Description (collect lines, join once)
+    parts = [
+        f"**Problem:** {question_data['title']}",
+        f"**Total Submissions:** {total_subs}",
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
+    ]
     
     if not subs:
-        desc += "*Waiting for the first brave student...* 🕒"
+        parts.append("*Waiting for the first brave student...* 🕒")
     else:
         # Show Top 50
-        for i, sub in enumerate(subs[:50], 1):
-            user = guild.get_member(sub["user_id"])
+        members = await resolve_members(guild, [s["user_id"] for s in subs])
+        for i, sub in enumerate(subs, 1):
+            user = members.get(sub["user_id"])
             username = user.display_name if user else "Unknown Student"
             
             # Time formatting
@@ -116,13 +283,10 @@ async def update_live_leaderboard(question_id, guild):
             time_str = f"{minutes}m {seconds}s"
             
             # Medals
-            if i == 1: icon = "🥇"
-            elif i == 2: icon = "🥈"
-            elif i == 3: icon = "🥉"
-            elif i <= 10: icon = "🏅"
-            else: icon = f"**{i}.**"
+            icon = LIVE_ICONS[i] if i < len(LIVE_ICONS) else f"**{i}.**"
 
-            desc += f"{icon} `{username}` • **{sub['score']}** pts • *{time_str}*\n"
+            parts.append(f"{icon} `{username}` • **{sub['score']}** pts • *{time_str}*")
+    desc = "\n".join(parts)
 
     embed = discord.Embed(
         title=f"📊 Live Leaderboard: {question_data['title']}", 
@@ -130,17 +294,39 @@ async def update_live_leaderboard(question_id, guild):
         color=COLOR_GOLD,
         timestamp=datetime.now(timezone.utc)
     )
-    if bot.user.avatar:
-        embed.set_thumbnail(url=bot.user.avatar.url)
+    if BOT_AVATAR_URL:
+        embed.set_thumbnail(url=BOT_AVATAR_URL)
     embed.set_footer(text="Updates in real-time • Ranked by Score & Speed")
 
     channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)
     if channel:
         try:
-            msg = await channel.fetch_message(question_data["leaderboard_msg_id"])
-            await msg.edit(embed=embed)
-        except:
-            pass
+            # PATCH only; no need to GET the message first
+            await channel.get_partial_message(question_data["leaderboard_msg_id"]).edit(embed=embed)
+        except discord.NotFound:
+            # Leaderboard message was deleted -> repost and remember the new id
+            msg = await channel.send(embed=embed)
+            await questions_col.update_one({"_id": question_id}, {"$set": {"leaderboard_msg_id": msg.id}})
+        except discord.HTTPException as e:
+            print(f"⚠️ Leaderboard update failed: {e}")
+
+# --- Helper: Coalesce Leaderboard Refreshes ---
+async def _debounced_refresh(question_id, guild):
+    try:
+        await asyncio.sleep(LEADERBOARD_DEBOUNCE_SECONDS)
+    finally:
+        # Submissions arriving after this point schedule a fresh refresh
+        pending_refresh.pop(question_id, None)
+    # Nobody awaits this task, so errors must be logged here or they vanish
+    try:
+        await update_live_leaderboard(question_id, guild)
+    except (PyMongoError, discord.HTTPException) as e:
+        print(f"❌ Leaderboard refresh failed for {question_id}: {e}")
+
+def schedule_leaderboard_refresh(question_id, guild):
+    # One refresh per question per debounce window, no matter how many submissions
+    if question_id not in pending_refresh:
+        pending_refresh[question_id] = asyncio.create_task(_debounced_refresh(question_id, guild))
 
 # --- UI: Code Submission Modal ---
 class CodeModal(ui.Modal, title="Submit Your Code"):
@@ -159,13 +345,14 @@ class CodeModal(ui.Modal, title="Submit Your Code"):
         self.desc = desc
 
     async def on_submit(self, interaction: discord.Interaction):
+        now = datetime.now(timezone.utc)
+
         # 1. Timer Logic
         timer_key = f"{interaction.user.id}_{self.question_id}"
-        start_time = attempt_timers.get(timer_key)
+        start_time = attempt_timers.pop(timer_key, None)
         duration = 0
-        if start_time:
-            duration = (datetime.now(timezone.utc) - start_time).total_seconds()
-            if timer_key in attempt_timers: del attempt_timers[timer_key]
+        if start_time is not None:
+            duration = time.monotonic() - start_time
 
         # 2. Speed Trap (15s)
         if duration < 15:
@@ -174,14 +361,13 @@ class CodeModal(ui.Modal, title="Submit Your Code"):
             return
 
         # 3. Sloppy Paste Filter
-        banned = ["here is the code", "as an ai", "hope this helps"]
-        if any(p in self.code_input.value.lower() for p in banned):
+        if BANNED_RE.search(self.code_input.value):
             embed = discord.Embed(title="⛔ Submission Rejected", description="AI conversational text detected. Submit ONLY the code.", color=COLOR_DANGER)
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        # 4. Duplicate Check
-        if submissions_col.find_one({"user_id": interaction.user.id, "question_id": self.question_id}):
+        # 4. Duplicate Check (cheap early exit; the unique index is the real guard)
+        if await submissions_col.find_one({"user_id": interaction.user.id, "question_id": self.question_id}, projection={"_id": 1}):
             await interaction.response.send_message("⚠️ You have already submitted.", ephemeral=True)
             return
 
@@ -189,6 +375,12 @@ class CodeModal(ui.Modal, title="Submit Your Code"):
 
         # 5. AI Grading
         result = await grade_submission(self.title, self.desc, self.code_input.value, self.language)
+        if result is None:
+            # Grader failed, not the student: save nothing so they can submit again
+            embed = discord.Embed(title="⚠️ Grading Unavailable", description="The AI grader timed out or hit an error. Nothing was recorded — select a language and submit again.", color=COLOR_WARNING)
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
+
         score = result.get("score", 0)
         feedback = result.get("feedback", "No feedback.")
         is_ai_suspected = result.get("is_ai_suspected", False)
@@ -198,19 +390,30 @@ class CodeModal(ui.Modal, title="Submit Your Code"):
             feedback = "⚠️ **AI Detection Alert:** Code style strongly resembles AI generation."
 
         # 6. Save Data
-        submissions_col.insert_one({
-            "user_id": interaction.user.id,
-            "question_id": self.question_id,
-            "score": score,
-            "feedback": feedback,
-            "language": self.language,
-            "duration_seconds": duration,
-            "is_ai_flagged": is_ai_suspected,
-            "timestamp": datetime.now(timezone.utc)
-        })
+        # Sequential on purpose: the insert is the duplicate guard (unique index),
+        # so nothing that credits points may run until it has succeeded
+        try:
+            await submissions_col.insert_one({
+                "user_id": interaction.user.id,
+                "question_id": self.question_id,
+                "score": score,
+                "feedback": feedback,
+                "language": self.language,
+                "duration_seconds": duration,
+                "is_ai_flagged": is_ai_suspected,
+                "timestamp": now
+            })
+        except DuplicateKeyError:
+            await interaction.followup.send("⚠️ You have already submitted.", ephemeral=True)
+            return
 
         if score > 0:
-            users_col.update_one({"_id": interaction.user.id}, {"$inc": {"score": score}}, upsert=True)
+            pending_score_ops.append((UpdateOne({"_id": interaction.user.id}, {"$inc": {"score": score}}, upsert=True), 0))
+        try:
+            await record_submission(self.question_id, interaction.user.id, score, duration)
+        except PyMongoError as e:
+            # Submission itself is saved; backfill_leaderboards repairs top/sub_count on next start
+            print(f"❌ Leaderboard record failed for {interaction.user.id} on {self.question_id}: {e}")
 
         # 7. Result Embed
         color = COLOR_SUCCESS if score >= 50 else COLOR_DANGER
@@ -218,7 +421,7 @@ class CodeModal(ui.Modal, title="Submit Your Code"):
         
         mins, secs = int(duration // 60), int(duration % 60)
         
-        embed = discord.Embed(title=f"📝 Grading Result", color=color, timestamp=datetime.now(timezone.utc))
+        embed = discord.Embed(title=f"📝 Grading Result", color=color, timestamp=now)
         embed.add_field(name="Score", value=f"**{score}/100**", inline=True)
         embed.add_field(name="Time", value=f"`{mins}m {secs}s`", inline=True)
         embed.add_field(name="Language", value=f"`{self.language}`", inline=True)
@@ -228,55 +431,70 @@ class CodeModal(ui.Modal, title="Submit Your Code"):
         await interaction.followup.send(embed=embed, ephemeral=True)
 
         if not is_ai_suspected:
-            await update_live_leaderboard(self.question_id, interaction.guild)
+            schedule_leaderboard_refresh(self.question_id, interaction.guild)
 
 # --- UI: Language Select ---
 class LanguageSelect(ui.Select):
-    def __init__(self, q_id, title, desc):
+    def __init__(self):
         options = [
             discord.SelectOption(label="C", value="C", emoji="🔹", description="Standard C"),
             discord.SelectOption(label="C++", value="C++", emoji="⚙️", description="Standard C++"),
             discord.SelectOption(label="Java", value="Java", emoji="☕", description="Standard Java"),
             discord.SelectOption(label="Python", value="Python", emoji="🐍", description="Python 3"),
         ]
-        super().__init__(placeholder="Select Language to Start Timer...", options=options)
-        self.q_id = q_id
-        self.title = title
-        self.desc = desc
+        # Stable custom_id so one persistent view serves every question post (survives restarts)
+        super().__init__(placeholder="Select Language to Start Timer...", options=options, custom_id="lang_select")
 
     async def callback(self, interaction: discord.Interaction):
-        attempt_timers[f"{interaction.user.id}_{self.q_id}"] = datetime.now(timezone.utc)
-        
-        q_data = questions_col.find_one({"_id": self.q_id})
+        q_data = await questions_col.find_one({"question_msg_id": interaction.message.id})
         if not q_data or not q_data.get("active", False):
             await interaction.response.send_message("❌ This question is closed.", ephemeral=True)
             return
-            
-        await interaction.response.send_modal(CodeModal(self.values[0], self.q_id, self.title, self.desc))
+
+        q_id = q_data["_id"]
+        timer_key = f"{interaction.user.id}_{q_id}"
+        attempt_timers[timer_key] = time.monotonic()
+
+        await interaction.response.send_modal(CodeModal(self.values[0], q_id, q_data["title"], q_data["description"]))
 
 class QuestionView(ui.View):
-    def __init__(self, q_id, title, desc):
+    def __init__(self):
         super().__init__(timeout=None)
-        self.add_item(LanguageSelect(q_id, title, desc))
+        self.add_item(LanguageSelect())
+
+# Single shared instance, created in setup_hook (views need a running loop)
+QUESTION_VIEW = None
 
 # --- Bot Events ---
+@bot.event
+async def setup_hook():
+    global QUESTION_VIEW, AI_SEM
+    # Runs once before connecting (unlike on_ready, which fires on every reconnect)
+    await ensure_indexes()
+    await backfill_leaderboards()
+    flush_score_updates.start()
+    QUESTION_VIEW = QuestionView()
+    AI_SEM = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    bot.add_view(QUESTION_VIEW)
+
 @bot.event
 async def on_ready():
-    keep_alive()
+    global BOT_AVATAR_URL
+    BOT_AVATAR_URL = str(bot.user.avatar.url) if bot.user.avatar else None
     print(f"✅ {bot.user} is Online & Professional!")
 
 @bot.command()
 @commands.has_role(LECTURER_ROLE_NAME)
 async def post(ctx, *, args):
+    now = datetime.now(timezone.utc)
     try:
-        parts = args.split('|')
-        title = parts[0].strip()
-        description = parts[1].strip()
-    except:
+        # Only the first '|' separates title from description
+        title, description = (p.strip() for p in args.split('|', 1))
+    except ValueError:
         await ctx.send(embed=discord.Embed(title="❌ Syntax Error", description="Usage: `!post Title | Description`", color=COLOR_DANGER))
         return
 
-    questions_col.update_many({"active": True}, {"$set": {"active": False}})
+    await questions_col.update_many({"active": True}, {"$set": {"active": False}})
     question_id = str(ctx.message.id)
     
     # Initial Leaderboard
@@ -287,33 +505,38 @@ async def post(ctx, *, args):
             title=f"📊 Live Leaderboard: {title}", 
             description="*Waiting for submissions...* 🕒", 
             color=COLOR_GOLD,
-            timestamp=datetime.now(timezone.utc)
+            timestamp=now
         )
-        if bot.user.avatar: embed.set_thumbnail(url=bot.user.avatar.url)
+        if BOT_AVATAR_URL: embed.set_thumbnail(url=BOT_AVATAR_URL)
         leaderboard_msg = await lb_channel.send(embed=embed)
 
-    questions_col.insert_one({
+    await questions_col.insert_one({
         "_id": question_id,
         "title": title,
         "description": description,
         "active": True,
         "leaderboard_msg_id": leaderboard_msg.id if leaderboard_msg else None,
-        "timestamp": datetime.now(timezone.utc)
+        "question_msg_id": None,
+        "top": [],
+        "sub_count": 0,
+        "timestamp": now
     })
 
     # Question Post
     q_channel = bot.get_channel(QUESTIONS_CHANNEL_ID)
     role = discord.utils.get(ctx.guild.roles, name=STUDENT_ROLE_NAME)
     
-    embed = discord.Embed(title=f"📢 New Challenge: {title}", description=description, color=COLOR_PRIMARY, timestamp=datetime.now(timezone.utc))
+    embed = discord.Embed(title=f"📢 New Challenge: {title}", description=description, color=COLOR_PRIMARY, timestamp=now)
     embed.add_field(name="⏳ Time Limit", value="24 Hours", inline=True)
     embed.add_field(name="🤖 AI Grading", value="Enabled", inline=True)
     embed.add_field(name="⚠️ Rules", value="• No Copy-Paste\n• No AI Generated Code", inline=False)
-    if bot.user.avatar: embed.set_thumbnail(url=bot.user.avatar.url)
+    if BOT_AVATAR_URL: embed.set_thumbnail(url=BOT_AVATAR_URL)
     embed.set_footer(text="Select a language below to begin. The timer starts immediately!")
 
     if q_channel:
-        await q_channel.send(content=f"{role.mention}", embed=embed, view=QuestionView(question_id, title, description))
+        question_msg = await q_channel.send(content=f"{role.mention}", embed=embed, view=QUESTION_VIEW)
+        # Lets the shared persistent view map this message back to its question
+        await questions_col.update_one({"_id": question_id}, {"$set": {"question_msg_id": question_msg.id}})
     
     try:
         await ctx.message.delete()
@@ -323,27 +546,25 @@ async def post(ctx, *, args):
 @bot.command()
 async def global_leaderboard(ctx):
     # TOP 50 Global
-    top_users = users_col.find().sort("score", -1).limit(50)
+    top_users = await users_col.find().sort("score", -1).limit(50).to_list(50)
     
-    desc = ""
-    count = 0
+    members = await resolve_members(ctx.guild, [u["_id"] for u in top_users])
+
+    parts = []
     for i, user_data in enumerate(top_users, 1):
-        user = ctx.guild.get_member(user_data["_id"])
+        user = members.get(user_data["_id"])
         if user:
             username = user.display_name
-            if i == 1: icon = "🏆"
-            elif i == 2: icon = "🥈"
-            elif i == 3: icon = "🥉"
-            else: icon = f"**{i}.**"
+            icon = GLOBAL_ICONS[i] if i < len(GLOBAL_ICONS) else f"**{i}.**"
             
-            desc += f"{icon} `{username}` — **{user_data['score']}** pts\n"
-            count += 1
+            parts.append(f"{icon} `{username}` — **{user_data['score']}** pts")
     
-    if count == 0: desc = "No data yet."
+    desc = "\n".join(parts) if parts else "No data yet."
 
     embed = discord.Embed(title="🏆 Hall of Fame (Top 50)", description=desc, color=discord.Color.purple(), timestamp=datetime.now(timezone.utc))
-    if bot.user.avatar: embed.set_thumbnail(url=bot.user.avatar.url)
+    if BOT_AVATAR_URL: embed.set_thumbnail(url=BOT_AVATAR_URL)
     
     await ctx.send(embed=embed)
 
+keep_alive()  # Start the web server once; on_ready fires again on every reconnect
 bot.run(TOKEN)